@@ -1782,6 +1782,35 @@ class DatabaseTestClientsMixin(object):
     results = list(self.db.DeleteOldClientStats(cutoff_time, batch_size=1))
     self.assertEqual(results, [1, 1, 1])
 
+  def testDeleteOldClientStats_SpreadOverTime(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+
+    start_time = self.db.Now() - rdfvalue.Duration.From(10, rdfvalue.HOURS)
+    offsets = [
+        rdfvalue.Duration.From(0, rdfvalue.MINUTES),
+        rdfvalue.Duration.From(10, rdfvalue.MINUTES),
+        # No stats are written for the next couple of hours.
+        rdfvalue.Duration.From(3, rdfvalue.HOURS),
+        rdfvalue.Duration.From(5, rdfvalue.HOURS),
+        rdfvalue.Duration.From(8, rdfvalue.HOURS),
+        rdfvalue.Duration.From(9, rdfvalue.HOURS),
+    ]
+    for i, offset in enumerate(offsets):
+      self.db.WriteClientStats(
+          client_id,
+          rdf_client_stats.ClientStats(
+              RSS_size=i, timestamp=start_time + offset))
+
+    cutoff_time = start_time + rdfvalue.Duration.From(6, rdfvalue.HOURS)
+    results = list(self.db.DeleteOldClientStats(cutoff_time, batch_size=3))
+    self.assertEqual(sum(results), 4)
+    for deleted_count in results:
+      self.assertBetween(deleted_count, 1, 3)
+
+    stats = self.db.ReadClientStats(
+        client_id, min_timestamp=start_time, max_timestamp=self.db.Now())
+    self.assertEqual([s.RSS_size for s in stats], [4, 5])
+
   def testDeleteOldClientStats_BatchSizeNegative(self):
     with self.assertRaises(ValueError):
       self.db.DeleteOldClientStats(cutoff_time=self.db.Now(), batch_size=-42)
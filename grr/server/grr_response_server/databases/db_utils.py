@@ -122,12 +122,14 @@ def ClientIdFromGrrMessage(m):
 
 # GRR Client IDs are strings of the form "C.<16 hex digits>", our F1 schema
 # uses uint64 values.
+@functools.lru_cache(maxsize=65536)
 def ClientIDToInt(client_id):
   if client_id[:2] != "C.":
     raise ValueError("Malformed client id received: %s" % client_id)
   return int(client_id[2:], 16)
 
 
+@functools.lru_cache(maxsize=65536)
 def IntToClientID(client_id):
   return "C.%016x" % client_id
 
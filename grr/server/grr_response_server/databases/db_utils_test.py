@@ -174,6 +174,25 @@ class CallLoggedAndAccountedTest(stats_test_lib.StatsTestMixin,
 
 class IdToIntConversionTest(absltest.TestCase):
 
+  def testClientIdToInt(self):
+    self.assertEqual(db_utils.ClientIDToInt("C.0000000000000001"), 1)
+    self.assertEqual(
+        db_utils.ClientIDToInt("C.1234abcd1234abcd"), 0x1234ABCD1234ABCD)
+    self.assertEqual(
+        db_utils.ClientIDToInt("C.ffffffffffffffff"), 0xFFFFFFFFFFFFFFFF)
+
+  def testClientIdToIntRaisesOnMalformedIdRepeatedly(self):
+    for _ in range(2):
+      with self.assertRaises(ValueError):
+        db_utils.ClientIDToInt("X.0000000000000001")
+
+  def testIntToClientId(self):
+    self.assertEqual(db_utils.IntToClientID(1), "C.0000000000000001")
+    self.assertEqual(
+        db_utils.IntToClientID(0x1234ABCD1234ABCD), "C.1234abcd1234abcd")
+    self.assertEqual(
+        db_utils.IntToClientID(0xFFFFFFFFFFFFFFFF), "C.ffffffffffffffff")
+
   def testFlowIdToInt(self):
     self.assertEqual(db_utils.FlowIDToInt("00000001"), 1)
     self.assertEqual(db_utils.FlowIDToInt("1234ABCD"), 0x1234ABCD)
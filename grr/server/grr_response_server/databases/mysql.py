@@ -12,6 +12,7 @@ import time
 from typing import Callable
 import warnings
 
+from google.protobuf.internal import api_implementation
 # Note: Please refer to server/setup.py for the MySQLdb version that is used.
 # It is most likely not up-to-date because of our support for older OS.
 import MySQLdb
@@ -132,6 +133,22 @@ def _CheckCollation(cursor):
         CREATE_DATABASE_QUERY)
 
 
+def _CheckProtobufImplementation():
+  """Warns if protobuf messages are parsed by the pure-Python implementation."""
+
+  # Do not fail, the datastore is fully functional either way. However, reading
+  # large histories (snapshots, crashes, stats) is dominated by protobuf
+  # parsing, which is an order of magnitude slower in pure Python.
+  implementation = api_implementation.Type()
+  if implementation == "python":
+    logging.warning(
+        "Protobuf messages are parsed by the pure-Python implementation, "
+        "expect degraded datastore read performance. Install a protobuf "
+        "package with the native extension and make sure the "
+        "PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION environment variable is not "
+        "set to 'python'.")
+
+
 def _SetEncoding(cursor):
   """Sets MySQL encoding and collation for current connection."""
   cursor.execute("SET NAMES '{}' COLLATE '{}'".format(CHARACTER_SET, COLLATION))
@@ -499,6 +516,7 @@ class MysqlDB(mysql_artifacts.MySQLDBArtifactsMixin,
           "Mysql.client_cert_path"]
       self._connect_args["ca_cert_path"] = config.CONFIG["Mysql.ca_cert_path"]
 
+    _CheckProtobufImplementation()
     _SetupDatabase(**self._connect_args)
 
     self._max_pool_size = config.CONFIG["Mysql.conn_pool_max"]
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 """The MySQL database methods for client handling."""
+from concurrent import futures
+import functools
 import itertools
 from typing import Collection, Iterator, List, Mapping, Optional, Text
 
@@ -13,6 +15,7 @@ from grr_response_core.lib.rdfvalues import client_network as rdf_client_network
 from grr_response_core.lib.rdfvalues import client_stats as rdf_client_stats
 from grr_response_core.lib.rdfvalues import crypto as rdf_crypto
 from grr_response_core.lib.rdfvalues import search as rdf_search
+from grr_response_core.lib.util import collection
 from grr_response_server import fleet_utils
 from grr_response_server.databases import db
 from grr_response_server.databases import db_utils
@@ -22,6 +25,76 @@ from grr_response_server.rdfvalues import rrg as rdf_rrg
 from grr_response_proto.rrg import startup_pb2 as rrg_startup_pb2
 
 
+def _SerializeSnapshotWithoutStartupInfo(
+    snapshot: rdf_objects.ClientSnapshot,
+) -> bytes:
+  """Serializes a snapshot with its startup info (stored separately) omitted."""
+  # Strip the startup info from a copy rather than from the snapshot itself,
+  # which belongs to the caller.
+  snapshot_without_startup_info = snapshot.Copy()
+  snapshot_without_startup_info.startup_info = None
+  return snapshot_without_startup_info.SerializeToBytes()
+
+
+@functools.lru_cache(maxsize=32)
+def _ClientStatisticByLabelQuery(statistic: str, num_day_buckets: int) -> str:
+  """Builds the query used to count clients by a statistic and label.
+
+  The query text only depends on the statistic and the number of day buckets,
+  so it is built once for every combination of these.
+
+  Args:
+    statistic: The name of the statistic, which should also be a column in the
+      'clients' table.
+    num_day_buckets: The number of n-day-active buckets.
+
+  Returns:
+    A query that expects the bucket thresholds (in increasing order of
+    buckets) followed by the threshold of the largest bucket, twice.
+  """
+  # Every client is assigned the index of the smallest n-day-active bucket it
+  # belongs to (and thus belongs to all the following ones as well). Clients
+  # that were not active within the largest bucket are filtered out.
+  bucket_clause = "CASE {} END".format(" ".join(
+      "WHEN c.last_ping > FROM_UNIXTIME(%s) THEN {}".format(i)
+      for i in range(num_day_buckets)))
+
+  # Count all clients with a label owned by 'GRR', aggregating by label, and
+  # get n-day-active totals for the statistic across all clients (including
+  # those that do not have a 'GRR' label) in a single round trip. Total rows
+  # have a NULL label, which is never the case for actual labels as they are
+  # part of the primary key.
+  #
+  # Note that the totals can not be computed from the per-label rows (e.g.
+  # using `WITH ROLLUP`), since a client with several labels would then be
+  # counted multiple times.
+  return """
+  SELECT c.{statistic}, l.label, {bucket_clause} AS bucket, COUNT(*)
+  FROM clients c
+  LEFT JOIN client_labels l USING(client_id)
+  WHERE c.last_ping > FROM_UNIXTIME(%s) AND l.owner_username = 'GRR'
+  GROUP BY c.{statistic}, l.label, bucket
+  UNION ALL
+  SELECT c.{statistic}, NULL, {bucket_clause} AS bucket, COUNT(*)
+  FROM clients c
+  WHERE c.last_ping > FROM_UNIXTIME(%s)
+  GROUP BY c.{statistic}, bucket
+  """.format(
+      statistic=statistic, bucket_clause=bucket_clause)
+
+
+def _FetchInBatches(
+    cursor: MySQLdb.cursors.Cursor,
+    batch_size: int,
+) -> Iterator[tuple]:
+  """Yields result rows of the last executed query fetched in batches."""
+  while True:
+    rows = cursor.fetchmany(batch_size)
+    if not rows:
+      return
+    yield from rows
+
+
 class MySQLDBClientMixin(object):
   """MySQLDataStore mixin for client related functions."""
 
@@ -39,52 +112,55 @@ class MySQLDBClientMixin(object):
       cursor: Optional[MySQLdb.cursors.Cursor] = None,
   ) -> None:
     """Write metadata about the client."""
-    placeholders = []
-    values = dict()
+    # The statement text is the same for every call: absent values are passed
+    # as `NULL` and leave the corresponding columns untouched.
+    query = """
+    INSERT INTO clients (client_id, certificate, first_seen, last_ping,
+                         last_clock, last_ip, last_foreman,
+                         last_fleetspeak_validation_info)
+    VALUES (%(client_id)s, %(certificate)s,
+            COALESCE(FROM_UNIXTIME(%(first_seen)s), NOW(6)),
+            FROM_UNIXTIME(%(last_ping)s), FROM_UNIXTIME(%(last_clock)s),
+            %(last_ip)s, FROM_UNIXTIME(%(last_foreman)s),
+            %(last_fleetspeak_validation_info)s)
+    ON DUPLICATE KEY UPDATE
+      certificate = COALESCE(VALUES(certificate), certificate),
+      first_seen = COALESCE(FROM_UNIXTIME(%(first_seen)s), first_seen),
+      last_ping = COALESCE(VALUES(last_ping), last_ping),
+      last_clock = COALESCE(VALUES(last_clock), last_clock),
+      last_ip = COALESCE(VALUES(last_ip), last_ip),
+      last_foreman = COALESCE(VALUES(last_foreman), last_foreman),
+      last_fleetspeak_validation_info = VALUES(last_fleetspeak_validation_info)
+    """
 
-    placeholders.append("%(client_id)s")
-    values["client_id"] = db_utils.ClientIDToInt(client_id)
+    values = {
+        "client_id": db_utils.ClientIDToInt(client_id),
+        "certificate": None,
+        "first_seen": None,
+        "last_ping": None,
+        "last_clock": None,
+        "last_ip": None,
+        "last_foreman": None,
+        # Write null for empty or non-existent validation info.
+        "last_fleetspeak_validation_info": None,
+    }
 
     if certificate:
-      placeholders.append("%(certificate)s")
       values["certificate"] = certificate.SerializeToBytes()
     if first_seen is not None:
-      placeholders.append("FROM_UNIXTIME(%(first_seen)s)")
       values["first_seen"] = mysql_utils.RDFDatetimeToTimestamp(first_seen)
     if last_ping is not None:
-      placeholders.append("FROM_UNIXTIME(%(last_ping)s)")
       values["last_ping"] = mysql_utils.RDFDatetimeToTimestamp(last_ping)
     if last_clock:
-      placeholders.append("FROM_UNIXTIME(%(last_clock)s)")
       values["last_clock"] = mysql_utils.RDFDatetimeToTimestamp(last_clock)
     if last_ip:
-      placeholders.append("%(last_ip)s")
       values["last_ip"] = last_ip.SerializeToBytes()
     if last_foreman:
-      placeholders.append("FROM_UNIXTIME(%(last_foreman)s)")
       values["last_foreman"] = mysql_utils.RDFDatetimeToTimestamp(last_foreman)
-
-    placeholders.append("%(last_fleetspeak_validation_info)s")
     if fleetspeak_validation_info:
       pb = rdf_client.FleetspeakValidationInfo.FromStringDict(
           fleetspeak_validation_info)
       values["last_fleetspeak_validation_info"] = pb.SerializeToBytes()
-    else:
-      # Write null for empty or non-existent validation info.
-      values["last_fleetspeak_validation_info"] = None
-
-    updates = []
-    for column in values:
-      updates.append("{column} = VALUES({column})".format(column=column))
-
-    query = """
-    INSERT INTO clients ({columns})
-    VALUES ({placeholders})
-    ON DUPLICATE KEY UPDATE {updates}
-    """.format(
-        columns=", ".join(values.keys()),
-        placeholders=", ".join(placeholders),
-        updates=", ".join(updates))
 
     cursor.execute(query, values)
 
@@ -110,10 +186,7 @@ class MySQLDBClientMixin(object):
         client_id IN ({})""".format(", ".join(["%s"] * len(ids)))
     ret = {}
     cursor.execute(query, ids)
-    while True:
-      row = cursor.fetchone()
-      if not row:
-        break
+    for row in cursor.fetchall():
       cid, crt, ping, clk, ip, foreman, first, lct, lst, fsvi = row
       metadata = rdf_objects.ClientMetadata(
           certificate=crt,
@@ -141,48 +214,47 @@ class MySQLDBClientMixin(object):
     """Write new client snapshot."""
     cursor.execute("SET @now = NOW(6)")
 
-    insert_history_query = (
-        "INSERT INTO client_snapshot_history(client_id, timestamp, "
-        "client_snapshot) VALUES (%s, @now, %s)")
-    insert_startup_query = (
-        "INSERT INTO client_startup_history(client_id, timestamp, "
-        "startup_info) VALUES(%s, @now, %s)")
+    insert_history_query = """
+    INSERT INTO client_snapshot_history (client_id, timestamp,
+                                         client_snapshot)
+    VALUES (%s, @now, %s)
+    """
+    insert_startup_query = """
+    INSERT INTO client_startup_history (client_id, timestamp,
+                                        startup_info)
+    VALUES (%s, @now, %s)
+    """
+    update_query = """
+    UPDATE clients
+       SET last_snapshot_timestamp = @now,
+           last_startup_timestamp = @now,
+           last_version_string = %(last_version_string)s,
+           last_platform = %(last_platform)s,
+           last_platform_release = %(last_platform_release)s
+     WHERE client_id = %(client_id)s
+    """
 
+    int_client_id = db_utils.ClientIDToInt(snapshot.client_id)
     client_info = {
+        "client_id": int_client_id,
         "last_version_string": snapshot.GetGRRVersionString(),
         "last_platform": snapshot.knowledge_base.os,
         "last_platform_release": snapshot.Uname(),
     }
-    update_clauses = [
-        "last_snapshot_timestamp = @now",
-        "last_startup_timestamp = @now",
-        "last_version_string = %(last_version_string)s",
-        "last_platform = %(last_platform)s",
-        "last_platform_release = %(last_platform_release)s",
-    ]
-
-    update_query = (
-        "UPDATE clients SET {} WHERE client_id = %(client_id)s".format(
-            ", ".join(update_clauses)))
 
-    int_client_id = db_utils.ClientIDToInt(snapshot.client_id)
-    client_info["client_id"] = int_client_id
-
-    startup_info = snapshot.startup_info
-    snapshot.startup_info = None
     try:
-      cursor.execute(insert_history_query,
-                     (int_client_id, snapshot.SerializeToBytes()))
-      cursor.execute(insert_startup_query,
-                     (int_client_id, startup_info.SerializeToBytes()))
+      cursor.execute(
+          insert_history_query,
+          (int_client_id, _SerializeSnapshotWithoutStartupInfo(snapshot)))
+      cursor.execute(
+          insert_startup_query,
+          (int_client_id, snapshot.startup_info.SerializeToBytes()))
       cursor.execute(update_query, client_info)
     except MySQLdb.IntegrityError as e:
       if e.args and e.args[0] == mysql_error_constants.NO_REFERENCED_ROW_2:
         raise db.UnknownClientError(snapshot.client_id, cause=e)
       else:
         raise
-    finally:
-      snapshot.startup_info = startup_info
 
   @mysql_utils.WithTransaction(readonly=True)
   def MultiReadClientSnapshot(self, client_ids, cursor=None):
@@ -205,15 +277,11 @@ class MySQLDBClientMixin(object):
     ret = {cid: None for cid in client_ids}
     cursor.execute(query, int_ids)
 
-    while True:
-      row = cursor.fetchone()
-      if not row:
-        break
-      cid, snapshot, timestamp, startup_info = row
-      client_obj = mysql_utils.StringToRDFProto(rdf_objects.ClientSnapshot,
-                                                snapshot)
-      client_obj.startup_info = mysql_utils.StringToRDFProto(
-          rdf_client.StartupInfo, startup_info)
+    for cid, snapshot, timestamp, startup_info in cursor.fetchall():
+      # Both blobs come from inner joins, so they are never `NULL`.
+      client_obj = rdf_objects.ClientSnapshot.FromSerializedBytes(snapshot)
+      client_obj.startup_info = rdf_client.StartupInfo.FromSerializedBytes(
+          startup_info)
       client_obj.timestamp = mysql_utils.TimestampToRDFDatetime(timestamp)
       ret[db_utils.IntToClientID(cid)] = client_obj
     return ret
@@ -268,52 +336,58 @@ class MySQLDBClientMixin(object):
         "latest_timestamp": mysql_utils.RDFDatetimeToTimestamp(latest_timestamp)
     }
 
-    try:
-      for client in clients:
-        startup_info = client.startup_info
-        client.startup_info = None
-
-        params = base_params.copy()
-        params.update({
-            "timestamp": mysql_utils.RDFDatetimeToTimestamp(client.timestamp),
-            "client_snapshot": client.SerializeToBytes(),
-            "startup_info": startup_info.SerializeToBytes(),
-        })
+    int_client_id = base_params["client_id"]
+    timestamps = [
+        mysql_utils.RDFDatetimeToTimestamp(client.timestamp)
+        for client in clients
+    ]
+    snapshot_values = [
+        (int_client_id, timestamp, _SerializeSnapshotWithoutStartupInfo(client))
+        for timestamp, client in zip(timestamps, clients)
+    ]
+    startup_values = [
+        (int_client_id, timestamp, client.startup_info.SerializeToBytes())
+        for timestamp, client in zip(timestamps, clients)
+    ]
 
+    # MySQLdb only rewrites `executemany` into a multi-row INSERT for plain
+    # placeholders, so the statements are built explicitly. Rows are written in
+    # batches to keep each statement well below `max_allowed_packet`.
+    try:
+      for batch in collection.Batch(snapshot_values,
+                                    _CLIENT_SNAPSHOT_HISTORY_BATCH_SIZE):
         cursor.execute(
             """
         INSERT INTO client_snapshot_history (client_id, timestamp,
                                              client_snapshot)
-        VALUES (%(client_id)s, FROM_UNIXTIME(%(timestamp)s),
-                %(client_snapshot)s)
-        """, params)
+        VALUES {}
+        """.format(", ".join(["(%s, FROM_UNIXTIME(%s), %s)"] * len(batch))),
+            list(itertools.chain.from_iterable(batch)))
 
+      for batch in collection.Batch(startup_values,
+                                    _CLIENT_SNAPSHOT_HISTORY_BATCH_SIZE):
         cursor.execute(
             """
         INSERT INTO client_startup_history (client_id, timestamp,
                                             startup_info)
-        VALUES (%(client_id)s, FROM_UNIXTIME(%(timestamp)s),
-                %(startup_info)s)
-        """, params)
-
-        client.startup_info = startup_info
-
-      cursor.execute(
-          """
-      UPDATE clients
-         SET last_snapshot_timestamp = FROM_UNIXTIME(%(latest_timestamp)s)
-       WHERE client_id = %(client_id)s
-         AND (last_snapshot_timestamp IS NULL OR
-              last_snapshot_timestamp < FROM_UNIXTIME(%(latest_timestamp)s))
-      """, base_params)
+        VALUES {}
+        """.format(", ".join(["(%s, FROM_UNIXTIME(%s), %s)"] * len(batch))),
+            list(itertools.chain.from_iterable(batch)))
 
       cursor.execute(
           """
       UPDATE clients
-         SET last_startup_timestamp = FROM_UNIXTIME(%(latest_timestamp)s)
+         SET last_snapshot_timestamp = IF(
+               last_snapshot_timestamp IS NULL OR
+               last_snapshot_timestamp < FROM_UNIXTIME(%(latest_timestamp)s),
+               FROM_UNIXTIME(%(latest_timestamp)s),
+               last_snapshot_timestamp),
+             last_startup_timestamp = IF(
+               last_startup_timestamp IS NULL OR
+               last_startup_timestamp < FROM_UNIXTIME(%(latest_timestamp)s),
+               FROM_UNIXTIME(%(latest_timestamp)s),
+               last_startup_timestamp)
        WHERE client_id = %(client_id)s
-         AND (last_startup_timestamp IS NULL OR
-              last_startup_timestamp < FROM_UNIXTIME(%(latest_timestamp)s))
       """, base_params)
     except MySQLdb.IntegrityError as error:
       raise db.UnknownClientError(client_id, cause=error)
@@ -377,15 +451,14 @@ class MySQLDBClientMixin(object):
   ) -> Optional[rrg_startup_pb2.Startup]:
     """Reads the latest RRG startup entry for the given client."""
     query = """
-    SELECT su.startup
-      FROM clients
-           LEFT JOIN (SELECT startup
-                        FROM client_rrg_startup_history
-                       WHERE client_id = %(client_id)s
-                    ORDER BY timestamp DESC
-                       LIMIT 1) AS su
-                     ON TRUE
-     WHERE client_id = %(client_id)s
+    SELECT EXISTS(SELECT 1
+                    FROM clients
+                   WHERE client_id = %(client_id)s),
+           (SELECT startup
+              FROM client_rrg_startup_history
+             WHERE client_id = %(client_id)s
+          ORDER BY timestamp DESC
+             LIMIT 1)
     """
     params = {
         "client_id": db_utils.ClientIDToInt(client_id),
@@ -393,11 +466,10 @@ class MySQLDBClientMixin(object):
 
     cursor.execute(query, params)
 
-    row = cursor.fetchone()
-    if row is None:
+    [(client_exists, startup_bytes)] = cursor.fetchall()
+    if not client_exists:
       raise db.UnknownClientError(client_id)
 
-    (startup_bytes,) = row
     if startup_bytes is None:
       return None
 
@@ -467,11 +539,9 @@ class MySQLDBClientMixin(object):
       ret.append(si)
     return ret
 
-  def _ResponseToClientsFullInfo(self, response):
-    """Creates a ClientFullInfo object from a database response."""
-    c_full_info = None
-    prev_cid = None
-    for row in response:
+  def _ResponseToClientsFullInfo(self, cursor, labels):
+    """Creates ClientFullInfo objects from rows fetched from the cursor."""
+    for row in _FetchInBatches(cursor, _CLIENT_FULL_INFO_FETCH_SIZE):
       (
           cid,
           crt,
@@ -487,79 +557,109 @@ class MySQLDBClientMixin(object):
           client_startup_obj,
           last_startup_obj,
           last_rrg_startup_obj,
-          label_owner,
-          label_name,
       ) = row
 
-      if cid != prev_cid:
-        if c_full_info:
-          yield db_utils.IntToClientID(prev_cid), c_full_info
-
-        metadata = rdf_objects.ClientMetadata(
-            certificate=crt,
-            first_seen=mysql_utils.TimestampToRDFDatetime(first),
-            ping=mysql_utils.TimestampToRDFDatetime(ping),
-            clock=mysql_utils.TimestampToRDFDatetime(clk),
-            ip=mysql_utils.StringToRDFProto(rdf_client_network.NetworkAddress,
-                                            ip),
-            last_foreman_time=mysql_utils.TimestampToRDFDatetime(foreman),
-            startup_info_timestamp=mysql_utils.TimestampToRDFDatetime(
-                last_startup_ts),
-            last_crash_timestamp=mysql_utils.TimestampToRDFDatetime(
-                last_crash_ts))
-
-        if client_obj is not None:
-          l_snapshot = rdf_objects.ClientSnapshot.FromSerializedBytes(
-              client_obj)
-          l_snapshot.timestamp = mysql_utils.TimestampToRDFDatetime(
-              last_client_ts)
-          l_snapshot.startup_info = rdf_client.StartupInfo.FromSerializedBytes(
-              client_startup_obj)
-          l_snapshot.startup_info.timestamp = l_snapshot.timestamp
-        else:
-          l_snapshot = rdf_objects.ClientSnapshot(
-              client_id=db_utils.IntToClientID(cid))
-
-        if last_startup_obj is not None:
-          startup_info = rdf_client.StartupInfo.FromSerializedBytes(
-              last_startup_obj)
-          startup_info.timestamp = mysql_utils.TimestampToRDFDatetime(
-              last_startup_ts)
-        else:
-          startup_info = None
-
-        if last_rrg_startup_obj is not None:
-          last_rrg_startup = rdf_rrg.Startup.FromSerializedBytes(
-              last_rrg_startup_obj,
-          )
-        else:
-          last_rrg_startup = None
-
-        prev_cid = cid
-        c_full_info = rdf_objects.ClientFullInfo(
-            metadata=metadata,
-            labels=[],
-            last_snapshot=l_snapshot,
-            last_startup_info=startup_info,
-            last_rrg_startup=last_rrg_startup,
-        )
+      client_id = db_utils.IntToClientID(cid)
+
+      metadata = rdf_objects.ClientMetadata(
+          certificate=crt,
+          first_seen=mysql_utils.TimestampToRDFDatetime(first),
+          ping=mysql_utils.TimestampToRDFDatetime(ping),
+          clock=mysql_utils.TimestampToRDFDatetime(clk),
+          ip=mysql_utils.StringToRDFProto(rdf_client_network.NetworkAddress,
+                                          ip),
+          last_foreman_time=mysql_utils.TimestampToRDFDatetime(foreman),
+          startup_info_timestamp=mysql_utils.TimestampToRDFDatetime(
+              last_startup_ts),
+          last_crash_timestamp=mysql_utils.TimestampToRDFDatetime(
+              last_crash_ts))
+
+      if client_obj is not None:
+        l_snapshot = rdf_objects.ClientSnapshot.FromSerializedBytes(client_obj)
+        l_snapshot.timestamp = mysql_utils.TimestampToRDFDatetime(
+            last_client_ts)
+        l_snapshot.startup_info = rdf_client.StartupInfo.FromSerializedBytes(
+            client_startup_obj)
+        l_snapshot.startup_info.timestamp = l_snapshot.timestamp
+      else:
+        l_snapshot = rdf_objects.ClientSnapshot(client_id=client_id)
 
-      if label_owner and label_name:
-        c_full_info.labels.append(
-            rdf_objects.ClientLabel(name=label_name, owner=label_owner))
+      if last_startup_obj is not None:
+        startup_info = rdf_client.StartupInfo.FromSerializedBytes(
+            last_startup_obj)
+        startup_info.timestamp = mysql_utils.TimestampToRDFDatetime(
+            last_startup_ts)
+      else:
+        startup_info = None
 
-    if c_full_info:
-      yield db_utils.IntToClientID(prev_cid), c_full_info
+      if last_rrg_startup_obj is not None:
+        last_rrg_startup = rdf_rrg.Startup.FromSerializedBytes(
+            last_rrg_startup_obj,
+        )
+      else:
+        last_rrg_startup = None
+
+      yield client_id, rdf_objects.ClientFullInfo(
+          metadata=metadata,
+          labels=labels.get(client_id, []),
+          last_snapshot=l_snapshot,
+          last_startup_info=startup_info,
+          last_rrg_startup=last_rrg_startup,
+      )
 
-  @mysql_utils.WithTransaction(readonly=True)
+  @db_utils.CallLoggedAndAccounted
   def MultiReadClientFullInfo(self,
                               client_ids,
                               min_last_ping=None,
                               cursor=None):
     """Reads full client information for a list of clients."""
+    # Large reads are split into shards that are read concurrently, each on
+    # its own pooled connection. Every shard is a separate readonly
+    # transaction, which is fine as clients are independent of each other.
+    #
+    # At most half of the pool is used, so that a large read does not starve
+    # other users of the database (e.g. frontends and flow processing).
+    num_shards = min(
+        _MAX_CLIENT_FULL_INFO_SHARDS,
+        self._max_pool_size // 2,
+        -(-len(client_ids) // _CLIENT_FULL_INFO_SHARD_SIZE))
+
+    if cursor is not None or num_shards <= 1:
+      return self._MultiReadClientFullInfo(
+          client_ids, min_last_ping=min_last_ping, cursor=cursor)
+
+    shard_size = -(-len(client_ids) // num_shards)
+    shards = collection.Batch(client_ids, shard_size)
+
+    result = {}
+    with futures.ThreadPoolExecutor(max_workers=num_shards) as executor:
+      shard_futures = [
+          executor.submit(
+              self._MultiReadClientFullInfo,
+              shard,
+              min_last_ping=min_last_ping) for shard in shards
+      ]
+      for future in shard_futures:
+        result.update(future.result())
+
+    return result
+
+  @mysql_utils.WithTransaction(
+      readonly=True, cursor_class=MySQLdb.cursors.SSCursor)
+  def _MultiReadClientFullInfo(self,
+                               client_ids,
+                               min_last_ping=None,
+                               cursor=None):
+    """Reads full client information for a list of clients."""
     if not client_ids:
       return {}
 
+    # Labels are read separately: joining them into the query below would
+    # repeat the (potentially large) snapshot blobs once for every label. They
+    # are fully fetched before the main query is issued, as the cursor is
+    # unbuffered.
+    labels = self.MultiReadClientLabels(client_ids, cursor=cursor)
+
     query = """
     SELECT c.client_id, c.certificate, c.last_ip,
            UNIX_TIMESTAMP(c.last_ping),
@@ -570,8 +670,7 @@ class MySQLDBClientMixin(object):
            UNIX_TIMESTAMP(c.last_crash_timestamp),
            UNIX_TIMESTAMP(c.last_startup_timestamp),
            h.client_snapshot,
-           s.startup_info, s_last.startup_info, rrg_s_last.startup,
-           l.owner_username, l.label
+           s.startup_info, s_last.startup_info, rrg_s_last.startup
       FROM clients AS c FORCE INDEX (PRIMARY)
            LEFT JOIN client_snapshot_history AS h FORCE INDEX (PRIMARY)
                   ON c.client_id = h.client_id
@@ -588,8 +687,6 @@ class MySQLDBClientMixin(object):
                                        WHERE client_id = c.client_id
                                     ORDER BY timestamp DESC
                                        LIMIT 1)
-           LEFT JOIN client_labels AS l FORCE INDEX (PRIMARY)
-                  ON c.client_id = l.client_id
     """
 
     query += "WHERE c.client_id IN (%s) " % ", ".join(["%s"] * len(client_ids))
@@ -600,7 +697,7 @@ class MySQLDBClientMixin(object):
       values.append(mysql_utils.RDFDatetimeToTimestamp(min_last_ping))
 
     cursor.execute(query, values)
-    return dict(self._ResponseToClientsFullInfo(cursor.fetchall()))
+    return dict(self._ResponseToClientsFullInfo(cursor, labels))
 
   def ReadClientLastPings(self,
                           min_last_ping=None,
@@ -666,12 +763,13 @@ class MySQLDBClientMixin(object):
     if not client_ids or not keywords:
       return
 
-    args = []
+    keyword_hashes = [(mysql_utils.Hash(keyword), keyword)
+                      for keyword in keywords]
 
+    args = []
     for client_id in client_ids:
       int_client_id = db_utils.ClientIDToInt(client_id)
-      for keyword in keywords:
-        keyword_hash = mysql_utils.Hash(keyword)
+      for keyword_hash, keyword in keyword_hashes:
         args.append((int_client_id, keyword_hash, keyword))
 
     query = """
@@ -731,10 +829,11 @@ class MySQLDBClientMixin(object):
     if not client_ids or not labels:
       return
 
+    owner_hash = mysql_utils.Hash(owner)
+
     args = []
     for client_id in client_ids:
       client_id_int = db_utils.ClientIDToInt(client_id)
-      owner_hash = mysql_utils.Hash(owner)
 
       for label in labels:
         args.append((client_id_int, owner_hash, owner, label))
@@ -790,7 +889,11 @@ class MySQLDBClientMixin(object):
   def ReadAllClientLabels(self, cursor=None):
     """Reads the user labels for a list of clients."""
 
-    cursor.execute("SELECT DISTINCT label FROM client_labels")
+    cursor.execute("""
+    SELECT label
+      FROM client_labels FORCE INDEX (client_labels_by_label)
+  GROUP BY label
+    """)
 
     result = []
     for (label,) in cursor.fetchall():
@@ -843,7 +946,8 @@ class MySQLDBClientMixin(object):
     res.timestamp = mysql_utils.TimestampToRDFDatetime(timestamp)
     return res
 
-  @mysql_utils.WithTransaction(readonly=True)
+  @mysql_utils.WithTransaction(
+      readonly=True, cursor_class=MySQLdb.cursors.SSCursor)
   def ReadClientCrashInfoHistory(self, client_id, cursor=None):
     """Reads the full crash history for a particular client."""
     cursor.execute(
@@ -852,7 +956,7 @@ class MySQLDBClientMixin(object):
         "client_crash_history.client_id = %s "
         "ORDER BY timestamp DESC", [db_utils.ClientIDToInt(client_id)])
     ret = []
-    for timestamp, crash_info in cursor.fetchall():
+    for timestamp, crash_info in cursor:
       ci = rdf_client.ClientCrash.FromSerializedBytes(crash_info)
       ci.timestamp = mysql_utils.TimestampToRDFDatetime(timestamp)
       ret.append(ci)
@@ -885,7 +989,8 @@ class MySQLDBClientMixin(object):
       else:
         raise
 
-  @mysql_utils.WithTransaction(readonly=True)
+  @mysql_utils.WithTransaction(
+      readonly=True, cursor_class=MySQLdb.cursors.SSCursor)
   def ReadClientStats(self,
                       client_id: Text,
                       min_timestamp: rdfvalue.RDFDatetime,
@@ -906,7 +1011,7 @@ class MySQLDBClientMixin(object):
         ])
     return [
         rdf_client_stats.ClientStats.FromSerializedBytes(stats_bytes)
-        for stats_bytes, in cursor.fetchall()
+        for stats_bytes, in cursor
     ]
 
   # DeleteOldClientStats does not use a single transaction, since it runs for
@@ -920,27 +1025,74 @@ class MySQLDBClientMixin(object):
     if batch_size is None:
       batch_size = db.CLIENT_IDS_BATCH_SIZE
 
-    while True:
-      deleted_count = self._DeleteClientStatsBatch(cutoff_time, batch_size)
+    # Stats are deleted in consecutive time windows, so that every batch only
+    # touches a bounded range of the primary key instead of rescanning (not
+    # yet purged) deleted rows at the start of the table over and over again.
+    window_start = self._ReadOldestClientStatsTimestamp(
+        rdfvalue.RDFDatetime(0), cutoff_time)
 
-      # Do not yield a trailing 0 which occurs when an exact multiple of
-      # `yield_after_count` rows were in the table.
-      if deleted_count > 0:
-        yield deleted_count
-      else:
-        break
+    while window_start is not None:
+      window_end = min(window_start + _CLIENT_STATS_DELETION_WINDOW,
+                       cutoff_time)
+
+      while True:
+        deleted_count = self._DeleteClientStatsBatch(window_start, window_end,
+                                                     batch_size)
+
+        # Do not yield a trailing 0 which occurs when an exact multiple of
+        # `batch_size` rows were in the window.
+        if deleted_count > 0:
+          yield deleted_count
+
+        # A partial batch means that the window has been emptied, there is no
+        # need for another (empty) delete to find that out.
+        if deleted_count < batch_size:
+          break
+
+      # Skip over windows without any stats.
+      window_start = self._ReadOldestClientStatsTimestamp(
+          window_end, cutoff_time)
+
+  @mysql_utils.WithTransaction(readonly=True)
+  def _ReadOldestClientStatsTimestamp(
+      self,
+      min_timestamp: rdfvalue.RDFDatetime,
+      max_timestamp: rdfvalue.RDFDatetime,
+      cursor: Optional[MySQLdb.cursors.Cursor] = None,
+  ) -> Optional[rdfvalue.RDFDatetime]:
+    """Reads the oldest ClientStats timestamp in [min, max) if there is one."""
+    cursor.execute(
+        """
+        SELECT UNIX_TIMESTAMP(MIN(timestamp))
+          FROM client_stats
+         WHERE timestamp >= FROM_UNIXTIME(%s)
+           AND timestamp < FROM_UNIXTIME(%s)
+        """, [
+            mysql_utils.RDFDatetimeToTimestamp(min_timestamp),
+            mysql_utils.RDFDatetimeToTimestamp(max_timestamp)
+        ])
+    [(timestamp,)] = cursor.fetchall()
+    return mysql_utils.TimestampToRDFDatetime(timestamp)
 
   @mysql_utils.WithTransaction()
   def _DeleteClientStatsBatch(
       self,
-      cutoff_time: rdfvalue.RDFDatetime,
+      min_timestamp: rdfvalue.RDFDatetime,
+      max_timestamp: rdfvalue.RDFDatetime,
       batch_size: int,
       cursor: Optional[MySQLdb.cursors.Cursor] = None,
   ) -> int:
-    """Deletes up to `limit` ClientStats older than `retention_time`."""
+    """Deletes up to `batch_size` ClientStats written in [min, max)."""
     cursor.execute(
-        "DELETE FROM client_stats WHERE timestamp < FROM_UNIXTIME(%s) LIMIT %s",
-        [mysql_utils.RDFDatetimeToTimestamp(cutoff_time), batch_size])
+        """
+        DELETE FROM client_stats
+         WHERE timestamp >= FROM_UNIXTIME(%s)
+           AND timestamp < FROM_UNIXTIME(%s)
+         LIMIT %s
+        """, [
+            mysql_utils.RDFDatetimeToTimestamp(min_timestamp),
+            mysql_utils.RDFDatetimeToTimestamp(max_timestamp), batch_size
+        ])
     return cursor.rowcount
 
   @mysql_utils.WithTransaction(readonly=True)
@@ -971,95 +1123,51 @@ class MySQLDBClientMixin(object):
       cursor: MySQL cursor for executing queries.
     """
     day_buckets = sorted(day_buckets)
-    sum_clauses = []
-    ping_cast_clauses = []
-    timestamp_buckets = []
     now = rdfvalue.RDFDatetime.Now()
 
+    timestamp_buckets = []
     for day_bucket in day_buckets:
-      column_name = "days_active_{}".format(day_bucket)
-      sum_clauses.append(
-          "CAST(SUM({0}) AS UNSIGNED) AS {0}".format(column_name))
-      ping_cast_clauses.append(
-          "CAST(c.last_ping > FROM_UNIXTIME(%s) AS UNSIGNED) AS {}".format(
-              column_name))
       timestamp_bucket = now - rdfvalue.Duration.From(day_bucket, rdfvalue.DAYS)
       timestamp_buckets.append(
           mysql_utils.RDFDatetimeToTimestamp(timestamp_bucket))
 
-    # Count all clients with a label owned by 'GRR', aggregating by label.
-    query = """
-    SELECT j.{statistic}, j.label, {sum_clauses}
-    FROM (
-      SELECT c.{statistic} AS {statistic}, l.label AS label, {ping_cast_clauses}
-      FROM clients c
-      LEFT JOIN client_labels l USING(client_id)
-      WHERE c.last_ping IS NOT NULL AND l.owner_username = 'GRR'
-    ) AS j
-    GROUP BY j.{statistic}, j.label
-    """.format(
-        statistic=statistic,
-        sum_clauses=", ".join(sum_clauses),
-        ping_cast_clauses=", ".join(ping_cast_clauses))
-
-    cursor.execute(query, timestamp_buckets)
+    # The bucket thresholds are followed by the largest one again, which is
+    # used to filter out inactive clients. Both parts of the query need them.
+    bucket_values = timestamp_buckets + timestamp_buckets[-1:]
+
+    query = _ClientStatisticByLabelQuery(statistic, len(day_buckets))
+    cursor.execute(query, bucket_values + bucket_values)
 
     fleet_stats_builder = fleet_utils.FleetStatsBuilder(day_buckets)
-    for response_row in cursor.fetchall():
-      statistic_value, client_label = response_row[:2]
-      for i, num_actives in enumerate(response_row[2:]):
-        if num_actives <= 0:
-          continue
-        fleet_stats_builder.IncrementLabel(
-            client_label, statistic_value, day_buckets[i], delta=num_actives)
-
-    # Get n-day-active totals for the statistic across all clients (including
-    # those that do not have a 'GRR' label).
-    query = """
-    SELECT j.{statistic}, {sum_clauses}
-    FROM (
-      SELECT c.{statistic} AS {statistic}, {ping_cast_clauses}
-      FROM clients c
-      WHERE c.last_ping IS NOT NULL
-    ) AS j
-    GROUP BY j.{statistic}
-    """.format(
-        statistic=statistic,
-        sum_clauses=", ".join(sum_clauses),
-        ping_cast_clauses=", ".join(ping_cast_clauses))
-
-    cursor.execute(query, timestamp_buckets)
-
-    for response_row in cursor.fetchall():
-      statistic_value = response_row[0]
-      for i, num_actives in enumerate(response_row[1:]):
-        if num_actives <= 0:
-          continue
-        fleet_stats_builder.IncrementTotal(
-            statistic_value, day_buckets[i], delta=num_actives)
+    for statistic_value, client_label, bucket, count in cursor.fetchall():
+      if client_label is None:
+        fleet_stats_builder.IncrementTotalFromBucket(
+            statistic_value, day_buckets[bucket], delta=count)
+      else:
+        fleet_stats_builder.IncrementLabelFromBucket(
+            client_label, statistic_value, day_buckets[bucket], delta=count)
 
     return fleet_stats_builder.Build()
 
   @mysql_utils.WithTransaction()
   def DeleteClient(self, client_id, cursor=None):
     """Deletes a client with all associated metadata."""
-    cursor.execute("SELECT COUNT(*) FROM clients WHERE client_id = %s",
-                   [db_utils.ClientIDToInt(client_id)])
+    int_client_id = db_utils.ClientIDToInt(client_id)
 
-    if cursor.fetchone()[0] == 0:
-      raise db.UnknownClientError(client_id)
-
-    # Clean out foreign keys first.
+    # Clean out foreign keys first. There is no separate existence check: for
+    # an unknown client both statements below are no-ops, which is detected
+    # from the number of deleted rows.
     cursor.execute(
         """
     UPDATE clients SET
       last_crash_timestamp = NULL,
       last_snapshot_timestamp = NULL,
       last_startup_timestamp = NULL
-    WHERE client_id = %s""", [db_utils.ClientIDToInt(client_id)])
+    WHERE client_id = %s""", [int_client_id])
 
-    cursor.execute("DELETE FROM clients WHERE client_id = %s",
-                   [db_utils.ClientIDToInt(client_id)])
+    cursor.execute("DELETE FROM clients WHERE client_id = %s", [int_client_id])
+    if cursor.rowcount == 0:
+      raise db.UnknownClientError(client_id)
 
   def StructuredSearchClients(self, expression: rdf_search.SearchExpression,
                               sort_order: rdf_search.SortOrder,
@@ -1074,3 +1182,17 @@ class MySQLDBClientMixin(object):
 # measures for. However, MySQL has different performance characteristics and it
 # could be fine-tuned if possible.
 _DEFAULT_CLIENT_STATS_BATCH_SIZE = 10_000
+
+# Maximum number of rows written by a single `WriteClientSnapshotHistory`
+# INSERT statement.
+_CLIENT_SNAPSHOT_HISTORY_BATCH_SIZE = 50
+
+# Width of the time windows in which `DeleteOldClientStats` deletes stats.
+_CLIENT_STATS_DELETION_WINDOW = rdfvalue.Duration.From(1, rdfvalue.HOURS)
+
+# `MultiReadClientFullInfo` calls with more client ids than this are split into
+# shards that are read concurrently on separate connections. The number of
+# shards is additionally limited to half of the connection pool size.
+_CLIENT_FULL_INFO_SHARD_SIZE = 256
+_MAX_CLIENT_FULL_INFO_SHARDS = 8
+_CLIENT_FULL_INFO_FETCH_SIZE = 1024
@@ -1,9 +1,17 @@
 #!/usr/bin/env python
+from unittest import mock
+
 from absl import app
 from absl.testing import absltest
 
+from grr_response_core.lib import rdfvalue
+from grr_response_core.lib.rdfvalues import client as rdf_client
 from grr_response_server.databases import db_clients_test
+from grr_response_server.databases import db_test_utils
+from grr_response_server.databases import mysql_clients
+from grr_response_server.databases import mysql_pool
 from grr_response_server.databases import mysql_test
+from grr_response_server.rdfvalues import objects as rdf_objects
 from grr.test_lib import test_lib
 
 
@@ -15,6 +23,85 @@ class MysqlClientsTest(db_clients_test.DatabaseTestClientsMixin,
     self.skipTest("Foreign key constraint on the `users` table not enforced.")
     super().testMultiAddClientLabelsUnknownUser()
 
+  @mock.patch.object(mysql_clients, "_CLIENT_SNAPSHOT_HISTORY_BATCH_SIZE", 2)
+  def testWriteClientSnapshotHistoryBatched(self):
+    client_id = db_test_utils.InitializeClient(self.db)
+
+    snapshots = []
+    for i in range(5):
+      snapshot = rdf_objects.ClientSnapshot(client_id=client_id)
+      snapshot.kernel = "1.2.{}".format(i)
+      snapshot.startup_info.client_info.client_version = i
+      snapshot.timestamp = rdfvalue.RDFDatetime.FromSecondsSinceEpoch(
+          1_000_000 + i)
+      snapshots.append(snapshot)
+
+    with mock.patch.object(
+        mysql_pool._CursorProxy,
+        "execute",
+        autospec=True,
+        side_effect=mysql_pool._CursorProxy.execute) as execute_mock:
+      self.db.WriteClientSnapshotHistory(snapshots)
+
+    queries = [call[0][1] for call in execute_mock.call_args_list]
+    # 5 rows in batches of 2 for each of the two history tables.
+    self.assertLen(
+        [q for q in queries if "INSERT INTO client_snapshot_history" in q], 3)
+    self.assertLen(
+        [q for q in queries if "INSERT INTO client_startup_history" in q], 3)
+
+    history = self.db.ReadClientSnapshotHistory(client_id)
+    self.assertEqual([snapshot.kernel for snapshot in history],
+                     ["1.2.4", "1.2.3", "1.2.2", "1.2.1", "1.2.0"])
+    self.assertEqual(
+        [snapshot.startup_info.client_info.client_version
+         for snapshot in history],
+        [4, 3, 2, 1, 0])
+    self.assertEqual(
+        [snapshot.timestamp for snapshot in history],
+        [rdfvalue.RDFDatetime.FromSecondsSinceEpoch(1_000_000 + i)
+         for i in reversed(range(5))])
+
+  @mock.patch.object(mysql_clients, "_CLIENT_FULL_INFO_SHARD_SIZE", 4)
+  def testMultiReadClientFullInfoSharded(self):
+    self.db.WriteGRRUser("test_owner")
+
+    client_ids = []
+    for i in range(13):
+      client_id = db_test_utils.InitializeClient(self.db)
+      client_ids.append(client_id)
+
+      self.db.WriteClientSnapshot(
+          rdf_objects.ClientSnapshot(
+              client_id=client_id,
+              kernel="12.{}".format(i),
+              startup_info=rdf_client.StartupInfo(boot_time=i)))
+      if i % 2 == 0:
+        self.db.AddClientLabels(client_id, "test_owner",
+                                ["foo", "bar-{}".format(i)])
+
+    delegate = self.db.delegate
+    expected = delegate._MultiReadClientFullInfo(client_ids)
+    self.assertLen(expected, 13)
+
+    with mock.patch.object(
+        delegate,
+        "_MultiReadClientFullInfo",
+        wraps=delegate._MultiReadClientFullInfo) as read_mock:
+      result = self.db.MultiReadClientFullInfo(client_ids)
+
+    self.assertGreater(read_mock.call_count, 1)
+    self.assertEqual(result, expected)
+    for i, client_id in enumerate(client_ids):
+      self.assertEqual(result[client_id].last_snapshot.kernel,
+                       "12.{}".format(i))
+      if i % 2 == 0:
+        self.assertCountEqual(
+            [label.name for label in result[client_id].labels],
+            ["foo", "bar-{}".format(i)])
+      else:
+        self.assertEmpty(result[client_id].labels)
+
 
 if __name__ == "__main__":
   app.run(test_lib.main)
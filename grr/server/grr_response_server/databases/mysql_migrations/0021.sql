@@ -0,0 +1,4 @@
+-- Allows listing all distinct labels (see `ReadAllClientLabels`) with a loose
+-- index scan instead of a scan of the whole table.
+CREATE INDEX client_labels_by_label
+    ON client_labels(label);
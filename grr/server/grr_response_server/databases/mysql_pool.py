@@ -131,8 +131,8 @@ class _ConnectionProxy(object):
   def rollback(self):
     self.con.rollback()
 
-  def cursor(self):
-    return _CursorProxy(self, self.con.cursor())
+  def cursor(self, cursorclass=None):
+    return _CursorProxy(self, self.con.cursor(cursorclass))
 
   def warning_count(self):
     return self.con.warning_count()
@@ -257,6 +257,9 @@ class _CursorProxy(object):
   def fetchall(self):
     return self._forward(self.cursor.fetchall)
 
+  def __iter__(self):
+    return iter(self.fetchone, None)
+
   @property
   def arraysize(self):
     return self.cursor.arraysize
@@ -6,6 +6,7 @@ from unittest import mock
 from absl import app
 from absl.testing import absltest
 import MySQLdb
+import MySQLdb.cursors
 
 from grr_response_server.databases import mysql_pool
 from grr.test_lib import test_lib
@@ -83,7 +84,8 @@ class TestPool(absltest.TestCase):
         lambda c: c.callproc('my_proc'), lambda c: c.
         execute('SELECT foo FROM bar'), lambda c: c.executemany(
             'INSERT INTO foo(bar) VALUES %s', ['A', 'B']), lambda c: c.fetchone(
-            ), lambda c: c.fetchmany(size=5), lambda c: c.fetchall()
+            ), lambda c: c.fetchmany(size=5), lambda c: c.fetchall(),
+        lambda c: list(c)
     ]:
       # If we can fail 10 times, then failed connections aren't consuming
       # pool capacity.
@@ -134,6 +136,40 @@ class TestPool(absltest.TestCase):
         # whitebox: make sure the connection did end up on the idle list
         self.assertLen(pool.idle_conns, 1)
 
+  def testGoodConnectionIteration(self):
+    good_cursor_mock = mock.MagicMock()
+
+    good_connection_mock = mock.MagicMock()
+    good_connection_mock.cursor.return_value = good_cursor_mock
+
+    def gen_good():
+      return good_connection_mock
+
+    pool = mysql_pool.Pool(gen_good, max_size=5)
+
+    for _ in range(10):
+      good_cursor_mock.fetchone.side_effect = [('foo',), ('bar',), None]
+      con = pool.get()
+      cur = con.cursor()
+      self.assertEqual(list(cur), [('foo',), ('bar',)])
+      cur.close()
+      con.close()
+      # whitebox: make sure the connection did end up on the idle list
+      self.assertLen(pool.idle_conns, 1)
+
+  def testCursorClass(self):
+    connection_mock = mock.MagicMock()
+    pool = mysql_pool.Pool(lambda: connection_mock, max_size=5)
+
+    con = pool.get()
+    con.cursor().close()
+    connection_mock.cursor.assert_called_once_with(None)
+
+    connection_mock.cursor.reset_mock()
+    con.cursor(MySQLdb.cursors.SSCursor).close()
+    connection_mock.cursor.assert_called_once_with(MySQLdb.cursors.SSCursor)
+    con.close()
+
 
 if __name__ == '__main__':
   app.run(test_lib.main)
@@ -21,6 +21,7 @@ def StringToRDFProto(proto_type, value):
   return value if value is None else proto_type.FromSerializedBytes(value)
 
 
+@functools.lru_cache(maxsize=16384)
 def Hash(value: Text) -> bytes:
   """Calculate a 32 byte cryptographic hash of a unicode string using SHA-256.
 
@@ -181,17 +182,25 @@ class WithTransaction(object):
   process, the decorated function may be called again after a short delay.
   """
 
-  def __init__(self, readonly=False):
+  def __init__(self, readonly=False, cursor_class=None):
     """Constructs a decorator.
 
     Args:
       readonly: Whether the decorated function only requires a readonly
         transaction. Has no effect when a connection is provided.
+      cursor_class: MySQLdb cursor class to use for the provided cursor. If not
+        set, the connection's default (client-side, buffered) cursor is used,
+        which fetches the whole result set in a single read. Unbuffered cursors
+        (e.g. `MySQLdb.cursors.SSCursor`) should only be used for potentially
+        large result sets that are consumed row by row. Has no effect when a
+        cursor is provided or the function takes a connection.
     """
     self.readonly = readonly
+    self.cursor_class = cursor_class
 
   def __call__(self, func):
     readonly = self.readonly
+    cursor_class = self.cursor_class
 
     takes_args = inspect.getfullargspec(func).args
     takes_connection = "connection" in takes_args
@@ -228,7 +237,7 @@ class WithTransaction(object):
         return func(self, *args, **kw)
 
       def Closure(connection):
-        with contextlib.closing(connection.cursor()) as cursor:
+        with contextlib.closing(connection.cursor(cursor_class)) as cursor:
           new_kw = kw.copy()
           new_kw["cursor"] = cursor
           return func(self, *args, **new_kw)
@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
+from unittest import mock
+
 from absl import app
 from absl.testing import absltest
+import MySQLdb.cursors
 
 from grr_response_server.databases import mysql_utils
+from grr.test_lib import stats_test_lib
 from grr.test_lib import test_lib
 
 
@@ -11,6 +15,28 @@ class DocTest(test_lib.DocTest):
   module = mysql_utils
 
 
+class HashTest(absltest.TestCase):
+
+  def testKnownValue(self):
+    self.assertEqual(
+        mysql_utils.Hash("foo").hex(),
+        "2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae")
+
+  def testUnicode(self):
+    self.assertLen(mysql_utils.Hash("zażółć"), 32)
+    self.assertNotEqual(mysql_utils.Hash("zażółć"), mysql_utils.Hash("zazolc"))
+
+  def testRepeatedCallsAreCached(self):
+    mysql_utils.Hash.cache_clear()
+
+    first = mysql_utils.Hash("foo")
+    second = mysql_utils.Hash("foo")
+
+    self.assertEqual(first, second)
+    self.assertEqual(mysql_utils.Hash.cache_info().hits, 1)
+    self.assertEqual(mysql_utils.Hash.cache_info().misses, 1)
+
+
 class PlaceholdersTest(absltest.TestCase):
 
   def testEmpty(self):
@@ -86,6 +112,44 @@ class ColumnsTest(absltest.TestCase):
     self.assertEqual(mysql_utils.Columns(["a", "a_hash"]), "(`a`, `a_hash`)")
 
 
+class _FakeDatabase(object):
+
+  def __init__(self):
+    self.connection = mock.MagicMock()
+
+  def _RunInTransaction(self, function, readonly=False):
+    del readonly  # Unused.
+    return function(self.connection)
+
+  @mysql_utils.WithTransaction()
+  def DefaultCursor(self, cursor=None):
+    return cursor
+
+  @mysql_utils.WithTransaction(cursor_class=MySQLdb.cursors.SSCursor)
+  def UnbufferedCursor(self, cursor=None):
+    return cursor
+
+
+class WithTransactionTest(stats_test_lib.StatsTestMixin, absltest.TestCase):
+
+  def testDefaultCursorClass(self):
+    database = _FakeDatabase()
+    database.DefaultCursor()
+    database.connection.cursor.assert_called_once_with(None)
+
+  def testCursorClass(self):
+    database = _FakeDatabase()
+    database.UnbufferedCursor()
+    database.connection.cursor.assert_called_once_with(
+        MySQLdb.cursors.SSCursor)
+
+  def testCursorClassIgnoredForProvidedCursor(self):
+    database = _FakeDatabase()
+    cursor = mock.MagicMock()
+    self.assertIs(database.UnbufferedCursor(cursor=cursor), cursor)
+    database.connection.cursor.assert_not_called()
+
+
 def main(argv):
   test_lib.main(argv)
 
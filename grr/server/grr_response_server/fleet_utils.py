@@ -230,6 +230,29 @@ class FleetStatsBuilder(object):
     _ValidateBucket(day_bucket, self._day_buckets)
     self._total_counts[day_bucket][category_value] += delta
 
+  def IncrementLabelFromBucket(self,
+                               client_label: Text,
+                               category_value: Optional[Text],
+                               min_day_bucket: int,
+                               delta: int = 1):
+    """Increments label counts of `min_day_bucket` and all larger buckets."""
+    category_value = "" if category_value is None else category_value
+    _ValidateBucket(min_day_bucket, self._day_buckets)
+    for day_bucket in self._day_buckets:
+      if day_bucket >= min_day_bucket:
+        self._label_counts[day_bucket][client_label][category_value] += delta
+
+  def IncrementTotalFromBucket(self,
+                               category_value: Optional[Text],
+                               min_day_bucket: int,
+                               delta: int = 1):
+    """Increments total counts of `min_day_bucket` and all larger buckets."""
+    category_value = "" if category_value is None else category_value
+    _ValidateBucket(min_day_bucket, self._day_buckets)
+    for day_bucket in self._day_buckets:
+      if day_bucket >= min_day_bucket:
+        self._total_counts[day_bucket][category_value] += delta
+
   def Build(self) -> FleetStats:
     fleet_stats = FleetStats(self._day_buckets,
                              _DictFromDefaultDict(self._label_counts),
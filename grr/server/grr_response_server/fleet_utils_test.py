@@ -51,6 +51,35 @@ class FleetStatsTest(absltest.TestCase):
     with self.assertRaisesWithLiteralMatch(ValueError, expected_exception):
       builder.Build()
 
+  def testIncrementFromBucket(self):
+    builder = fleet_utils.FleetStatsBuilder({1, 5, 10})
+    builder.IncrementLabelFromBucket("foo-label", "category-foo", 5, delta=2)
+    builder.IncrementLabelFromBucket("foo-label", "category-foo", 1)
+    builder.IncrementTotalFromBucket("category-foo", 5, delta=2)
+    builder.IncrementTotalFromBucket("category-foo", 1)
+    fleet_stats = builder.Build()
+
+    self.assertDictEqual(fleet_stats.GetAggregatedLabelCounts(), {
+        "foo-label": {
+            1: 1,
+            5: 3,
+            10: 3,
+        },
+    })
+    self.assertDictEqual(fleet_stats.GetAggregatedTotalCounts(), {
+        1: 1,
+        5: 3,
+        10: 3,
+    })
+
+  def testIncrementFromBucketWithInvalidBucket(self):
+    builder = fleet_utils.FleetStatsBuilder({1, 5, 10})
+    expected_exception = "Invalid bucket '3'. Allowed buckets are [1, 5, 10]."
+    with self.assertRaisesWithLiteralMatch(ValueError, expected_exception):
+      builder.IncrementLabelFromBucket("foo-label", "category-foo", 3)
+    with self.assertRaisesWithLiteralMatch(ValueError, expected_exception):
+      builder.IncrementTotalFromBucket("category-foo", 3)
+
   def testGetAllLabelsAndBuckets(self):
     fleet_stats = _BuildTestStats()
     self.assertListEqual(fleet_stats.GetAllLabels(), ["bar-label", "foo-label"])